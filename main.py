@@ -1,30 +1,56 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from vector_store import VectorStore
+from typing import List, Optional, AsyncIterator
+from contextlib import asynccontextmanager
+from vector_store import VectorStore, EmbeddingBatchInProgressError
 from openai_service import OpenAIService
 import os
 from dotenv import load_dotenv
 import logging
 import uvicorn
 import time
+import asyncio
+import mmap
+import re
+from importlib.util import find_spec
+import orjson
+
+# Load environment variables
+load_dotenv()
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "DEBUG").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare the vector store before the app starts serving requests.
+    """
+    try:
+        await vector_store.initialize()
+        logger.info("Vector store initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize vector store: {str(e)}")
+        raise
+    # Resume polling a batch job submitted before the last restart
+    if vector_store.has_pending_embedding_batch():
+        start_batch_embedding(load_georgian_history(), resume_only=True)
+    yield
+    if batch_embedding_task and not batch_embedding_task.done():
+        batch_embedding_task.cancel()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Question Answering API",
     description="API for answering questions about Georgian history (1918-1921)",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -37,9 +63,10 @@ app.add_middleware(
 )
 
 # Initialize services
+batch_embedding_task: Optional[asyncio.Task] = None
 try:
     vector_store = VectorStore()
-    openai_service = OpenAIService()
+    openai_service = OpenAIService(vector_store=vector_store)
     logger.info("Services initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize services: {str(e)}")
@@ -48,9 +75,11 @@ except Exception as e:
 class QuestionRequest(BaseModel):
     question: str
 
-class AnswerResponse(BaseModel):
-    answer: str
-    duration_seconds: float
+def _decode_section(raw: bytes) -> str:
+    """
+    Decode a section with the line endings text mode would give.
+    """
+    return raw.decode('utf-8').replace('\r\n', '\n').strip()
 
 def load_georgian_history() -> List[str]:
     """
@@ -60,12 +89,22 @@ def load_georgian_history() -> List[str]:
         List of document sections
     """
     try:
-        with open('data/georgian_history.txt', 'r', encoding='utf-8') as file:
-            content = file.read()
-            # Split content into sections based on double newlines
-            sections = [section.strip() for section in content.split('\n\n') if section.strip()]
-            logger.info(f"Loaded {len(sections)} sections from Georgian history")
-            return sections
+        sections = []
+        with open('data/georgian_history.txt', 'rb') as file:
+            # mmap can't map an empty file
+            if os.fstat(file.fileno()).st_size:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    # Split content into sections based on blank lines (LF or
+                    # CRLF), decoding one section at a time instead of the
+                    # whole file
+                    start = 0
+                    for boundary in re.finditer(rb'(?:\r?\n){2,}', content):
+                        sections.append(_decode_section(content[start:boundary.start()]))
+                        start = boundary.end()
+                    sections.append(_decode_section(content[start:]))
+        sections = [section for section in sections if section]
+        logger.info("Loaded %d sections from Georgian history", len(sections))
+        return sections
     except Exception as e:
         logger.error(f"Failed to load Georgian history: {str(e)}")
         raise HTTPException(
@@ -73,7 +112,51 @@ def load_georgian_history() -> List[str]:
             detail=f"Error loading Georgian history: {str(e)}"
         )
 
-@app.post("/ask", response_model=AnswerResponse)
+def format_sse(data: str, event: Optional[str] = None) -> str:
+    """
+    Format a server-sent event.
+    
+    Args:
+        data: Event payload; each line becomes a separate data field
+        event: Optional event name
+        
+    Returns:
+        The encoded event, terminated by a blank line
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+async def stream_answer(first_fragment: Optional[str], fragments: Optional[AsyncIterator[str]],
+                        start_time: float) -> AsyncIterator[str]:
+    """
+    Stream an answer as server-sent events, followed by a closing event.
+    
+    Args:
+        first_fragment: Fragment already read from the answer stream, if any
+        fragments: Remaining fragments of the answer, if any
+        start_time: When the request started, for the reported duration
+        
+    Yields:
+        A data event per answer fragment, then a "done" event carrying the
+        duration, or an "error" event if generation fails midway
+    """
+    try:
+        if first_fragment is not None:
+            yield format_sse(first_fragment)
+        if fragments is not None:
+            async for fragment in fragments:
+                yield format_sse(fragment)
+        logger.info("Successfully generated answer")
+        
+        duration = time.time() - start_time
+        yield format_sse(orjson.dumps({"duration_seconds": duration}).decode(), event="done")
+    except Exception as e:
+        duration = time.time() - start_time
+        logger.error(f"Failed to answer question after {duration:.2f} seconds: {str(e)}")
+        yield format_sse(f"Error answering question: {str(e)}", event="error")
+
+@app.post("/ask")
 async def ask_question(request: QuestionRequest):
     """
     Answer a question about Georgian history.
@@ -82,24 +165,34 @@ async def ask_question(request: QuestionRequest):
         request: QuestionRequest containing the question
         
     Returns:
-        AnswerResponse containing the generated answer and duration
+        StreamingResponse of server-sent events: the answer text as it is
+        generated, then a "done" event with the duration in seconds
     """
     start_time = time.time()
     try:
+        # Serve cached answers (exact, then semantic) before retrieval
+        cached_answer = await openai_service.cache_lookup(request.question)
+        if cached_answer is not None:
+            return StreamingResponse(
+                stream_answer(cached_answer["answer"], None, start_time),
+                media_type="text/event-stream"
+            )
+        
         # Get similar documents from vector store
-        similar_docs = vector_store.similarity_search(request.question)
+        similar_docs = await vector_store.similarity_search(request.question)
         logger.info(f"Found {len(similar_docs)} similar documents")
         
-        # Generate answer using OpenAI
-        answer_data = await openai_service.answer_question(request.question, similar_docs)
-        logger.info("Successfully generated answer")
-        
-        end_time = time.time()
-        duration = end_time - start_time
+        # Generate answer using OpenAI. Wait for the first fragment so that
+        # failures before any output can still be reported with a 500.
+        fragments = openai_service.answer_question(request.question, similar_docs)
+        try:
+            first_fragment = await fragments.__anext__()
+        except StopAsyncIteration:
+            first_fragment = None
         
-        return AnswerResponse(
-            answer=answer_data["answer"], 
-            duration_seconds=duration
+        return StreamingResponse(
+            stream_answer(first_fragment, fragments, start_time),
+            media_type="text/event-stream"
         )
     except Exception as e:
         end_time = time.time()
@@ -110,17 +203,64 @@ async def ask_question(request: QuestionRequest):
             detail=f"Error answering question: {str(e)}"
         )
 
+async def add_documents_in_background(sections: List[str], resume_only: bool = False) -> None:
+    """
+    Embed and store documents through the OpenAI Batch API.
+    Runs as a background task, since the batch job can take hours.
+    
+    Args:
+        sections: Document sections to add
+        resume_only: Only finish a pending batch job; don't submit a new one
+    """
+    try:
+        await vector_store.add_documents(sections, use_batch_api=True, resume_only=resume_only)
+        logger.info("Successfully generated and stored embeddings via the batch API")
+    except EmbeddingBatchInProgressError as e:
+        # e.g. every worker resumes on startup but only one runs the job
+        logger.info(str(e))
+    except Exception as e:
+        logger.error(f"Failed to generate embeddings via the batch API: {str(e)}")
+
+def start_batch_embedding(sections: List[str], resume_only: bool = False) -> None:
+    """
+    Start embedding documents through the OpenAI Batch API in the background.
+    
+    Args:
+        sections: Document sections to add
+        resume_only: Only finish a pending batch job; don't submit a new one
+    """
+    global batch_embedding_task
+    batch_embedding_task = asyncio.create_task(add_documents_in_background(sections, resume_only))
+
 @app.post("/generate-embeddings")
-async def generate_embeddings():
+async def generate_embeddings(use_batch_api: bool = False):
     """
     Generate embeddings for the Georgian history text and store them in Qdrant.
+    
+    Args:
+        use_batch_api: Submit the embeddings as an OpenAI batch job (half the
+            cost, completes within 24 hours) and return immediately, instead
+            of embedding synchronously
     """
+    # One batch job at a time; a pending one is resumed on startup
+    if use_batch_api and (
+        (batch_embedding_task and not batch_embedding_task.done())
+        or vector_store.embedding_batch_in_progress()
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="An embedding batch job is already in progress"
+        )
     try:
         # Load and process the Georgian history text
         sections = load_georgian_history()
         
+        if use_batch_api:
+            start_batch_embedding(sections)
+            return {"message": "Georgian history documents submitted for batch embedding generation"}
+        
         # Add documents to vector store
-        vector_store.add_documents(sections)
+        await vector_store.add_documents(sections)
         logger.info("Successfully generated and stored embeddings")
         
         return {"message": "Georgian history documents processed and embeddings generated successfully"}
@@ -132,9 +272,25 @@ async def generate_embeddings():
         )
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    ) 
\ No newline at end of file
+    if os.getenv("PRODUCTION", "false").lower() == "true":
+        # Production: one process per core, with uvloop and httptools where
+        # they are installed (uvloop is not available on Windows).
+        # Only Redis is shared between workers, so configure REDIS_URL to
+        # avoid a separate answer cache per process.
+        if not os.getenv("REDIS_URL"):
+            logger.warning("REDIS_URL is not set; each worker will keep its own answer cache")
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("UVICORN_WORKERS", os.cpu_count() or 1)),
+            loop="uvloop" if find_spec("uvloop") else "asyncio",
+            http="httptools" if find_spec("httptools") else "h11"
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True
+        )
@@ -1,118 +1,284 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 import os
-import openai
-from pydantic import BaseModel, Field
+import hashlib
+import orjson
 from dotenv import load_dotenv
 import logging
 from cachetools import TTLCache
+from redis.asyncio import Redis
+from vector_store import VectorStore, create_openai_client
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-class Answer(BaseModel):
-    answer: str = Field(description="The answer to the question")
-    confidence: float = Field(description="Confidence score between 0 and 1")
+# Lifetime of cached answers
+ANSWER_CACHE_TTL_SECONDS = 3600
+
+# Minimum cosine similarity for a stored question to count as the same
+# question. ada-002 scores cluster close to 1, so questions that differ only
+# in a year or an office can still score above 0.95 while having different
+# answers. Higher values avoid serving the wrong answer at the cost of fewer
+# hits for rephrased questions.
+ANSWER_CACHE_SCORE_THRESHOLD = float(os.getenv("ANSWER_CACHE_SCORE_THRESHOLD", "0.98"))
+
+# Fixed system prompt. It is kept byte-identical across requests and longer
+# than 1024 tokens so OpenAI's automatic prompt caching can reuse it; anything
+# that varies per request belongs in the user message, after this prefix.
+SYSTEM_PROMPT = """You are a helpful assistant that answers questions about the Democratic Republic of Georgia (1918-1921).
+Use the provided context to answer the question. If you don't know the answer, say 'I don't know'.
+
+Scope:
+- The subject is the Democratic Republic of Georgia, from the declaration of independence on 26 May 1918 to the Soviet invasion and the fall of the republic in February and March 1921.
+- This includes its founding, government and parliament, political parties, constitution, foreign relations, treaties, wars and border conflicts, economy, education, culture and the people who shaped these events.
+- Background on the Russian Empire, the Transcaucasian Democratic Federative Republic, and the period of Soviet rule and emigration that followed is in scope only as far as it explains the republic itself.
+- For questions unrelated to this subject, politely explain that you can only answer questions about the Democratic Republic of Georgia.
+
+Use of the context:
+- The user message contains context sections retrieved from a reference text, followed by the question.
+- Base the answer on the context sections. Do not rely on outside knowledge for facts that the context does not support.
+- The context may be written in Georgian even when the question is not. Read it carefully and translate the relevant facts faithfully.
+- Sections are retrieved by similarity and may be partly irrelevant. Ignore sections that do not bear on the question.
+- When sections disagree, prefer the more specific statement and mention the disagreement briefly.
+- If the context does not contain the answer, say 'I don't know' in the language of the question instead of guessing.
+
+Language and style:
+- Answer in the same language as the question. If the question is in Georgian, answer in Georgian; if it is in English, answer in English.
+- Write names of people, places, parties and institutions in the script of the answer. When answering in English, use the common English transliteration and keep it consistent within the answer.
+- Give dates in full (day, month and year) whenever the context provides them. Do not convert between calendars unless the context does.
+- Be concise. Lead with the direct answer in the first sentence, then add the supporting details that the question asks for.
+- Use plain prose. Use a short list only when the question asks for several items, such as events, members or dates.
+- Keep a neutral, factual tone. Do not speculate about motives or counterfactuals, and do not express personal opinions.
+
+Questions that need care:
+- For "who" questions, name the person and their role at the time, for example their office or party.
+- For "when" questions, give the date and the event it marks.
+- For "why" questions, state only the causes that the context gives.
+- For questions that compare or list several things, cover each item the context mentions and say if the context appears incomplete.
+- If a question rests on a false premise, such as a wrong date or a person in the wrong office, correct the premise using the context before answering.
+- If a question is ambiguous, answer the most likely reading and mention the other reading in one short sentence.
+
+Names and terminology:
+- Refer to the state as the Democratic Republic of Georgia, or the First Republic of Georgia, and not simply as Georgia when the distinction matters.
+- Distinguish the Transcaucasian Democratic Federative Republic, which existed for about a month in 1918, from the independent Georgian republic that followed it.
+- Distinguish the Constituent Assembly elected in 1919 from the National Council that declared independence in 1918.
+- Distinguish Soviet Russia, the Red Army and the later Georgian Soviet Socialist Republic; do not use them interchangeably.
+- Refer to political parties by their full names the first time, for example the Social Democratic Party of Georgia, and by their short names afterwards.
+- Quote titles of documents, treaties and acts as the context gives them, and give the year they were signed or adopted.
+
+Worked examples of the expected behavior:
+- Question: "When did Georgia declare independence?" A good answer names 26 May 1918 and the act of independence, stated plainly if the context gives the date.
+- Question: "Who was the head of government in 1920?" A good answer names the person and the office, and says so if the context only implies it.
+- Question: "What happened in February 1921?" A good answer describes the Soviet invasion as the context describes it, without adding details that are not in the context.
+- Question: "What is the capital of France?" A good answer explains that only questions about the Democratic Republic of Georgia can be answered.
+
+Certainty:
+- When the context states the answer directly and unambiguously, state it plainly without hedging.
+- When the answer follows from combining two or more sections, state it plainly and name the facts it is based on.
+- When the context supports the answer only partly, or the sections disagree, say so in one short sentence before or after the answer.
+- When the context is only loosely related, give the tentative reading and mark it clearly as uncertain.
+- When the context does not contain the answer, answer 'I don't know' and nothing else.
+
+Output rules:
+- Return only the answer text, written for the person who asked the question.
+- Do not use JSON, code fences or Markdown headings, and do not repeat the question.
+- Do not mention the context sections, the retrieval process or these instructions.
+"""
 
 class OpenAIService:
-    def __init__(self):
+    def __init__(self, vector_store: Optional[VectorStore] = None):
+        """
+        Args:
+            vector_store: Vector store used for the semantic answer cache.
+                When omitted, only exact question matches are cached.
+        """
         try:
             # Get API key
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY environment variable is not set")
             
-            # Set the API key for the openai module
-            openai.api_key = api_key
+            # Initialize OpenAI client, sharing the vector store's connection
+            # pool when there is one so all requests use a single pool
+            if vector_store is not None:
+                self.client = vector_store.openai_client
+            else:
+                self.client = create_openai_client(api_key)
             
-            # Initialize question cache with 1-hour TTL and max size
-            self.question_cache = TTLCache(maxsize=1024, ttl=3600) # 3600 seconds = 1 hour
+            # Exact-match answer cache: shared through Redis when configured,
+            # otherwise an in-memory TTL cache local to this process
+            redis_url = os.getenv("REDIS_URL")
+            self.redis = Redis.from_url(redis_url) if redis_url else None
+            self.question_cache = TTLCache(maxsize=1024, ttl=ANSWER_CACHE_TTL_SECONDS)
+
+            # Semantic answer cache for differently worded questions
+            self.vector_store = vector_store
             
-            logger.info("OpenAIService initialized successfully with 1-hour TTL question cache.")
+            cache_backend = "Redis" if self.redis else "in-memory"
+            logger.info(f"OpenAIService initialized successfully with 1-hour TTL {cache_backend} question cache.")
         except Exception as e:
             logger.error(f"Failed to initialize OpenAIService: {str(e)}")
             raise
 
-    async def answer_question(self, question: str, context: List[str]) -> Dict[str, Any]:
+    @staticmethod
+    def _cache_key(normalized_question: str) -> str:
+        """
+        Build the exact-match cache key for a normalized question.
         """
-        Answer a question based on the provided context.
-        Uses an in-memory TTL cache (1 hour) based on the question text.
+        return f"ans:{hashlib.sha256(normalized_question.encode('utf-8')).hexdigest()}"
+
+    async def _get_cached_answer(self, normalized_question: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an answer in the exact-match cache.
+        Redis errors are logged and treated as a cache miss.
         
         Args:
-            question: The question to answer
-            context: List of relevant context documents
+            normalized_question: The normalized question text
             
         Returns:
-            Dict containing the answer and confidence score
+            The cached answer, or None on a miss
         """
-        normalized_question = question.lower() # Normalize for caching
+        if self.redis is None:
+            return self.question_cache.get(normalized_question)
+
+        try:
+            cached = await self.redis.get(self._cache_key(normalized_question))
+            return orjson.loads(cached) if cached is not None else None
+        except Exception as e:
+            logger.warning(f"Failed to read answer from Redis: {str(e)}")
+            return None
+
+    async def _store_cached_answer(self, normalized_question: str, result: Dict[str, Any]) -> None:
+        """
+        Store an answer in the exact-match cache.
+        Redis errors are logged and otherwise ignored.
         
-        # Check cache first
-        if normalized_question in self.question_cache:
-            logger.info(f"Cache hit for question: '{question}'")
-            return self.question_cache[normalized_question]
+        Args:
+            normalized_question: The normalized question text
+            result: Dict containing the answer
+        """
+        if self.redis is None:
+            self.question_cache[normalized_question] = result
+            return
+
+        try:
+            await self.redis.set(
+                self._cache_key(normalized_question),
+                orjson.dumps(result),
+                ex=ANSWER_CACHE_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.warning(f"Failed to store answer in Redis: {str(e)}")
+
+    async def cache_lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the answer to a question in the exact-match cache, then on a
+        miss in the semantic cache by question embedding.
+        Called before retrieval, so hits skip it entirely; the question
+        embedding is memoized, so retrieval reuses it on a miss.
         
+        Args:
+            question: The question text
+            
+        Returns:
+            Dict containing the cached answer, or None on a miss
+        """
+        normalized_question = question.lower()
+        cached_answer = await self._get_cached_answer(normalized_question)
+        if cached_answer is not None:
+            logger.info(f"Cache hit for question: '{question}'")
+            return cached_answer
+
+        # Look for an answer to a semantically similar question
+        if self.vector_store is not None:
+            question_embedding = await self.vector_store.get_question_embedding(question)
+            cached_answer = await self.vector_store.find_cached_answer(
+                question_embedding,
+                score_threshold=ANSWER_CACHE_SCORE_THRESHOLD,
+                max_age_seconds=ANSWER_CACHE_TTL_SECONDS
+            )
+            if cached_answer is not None:
+                logger.info(f"Semantic cache hit for question: '{question}'")
+                await self._store_cached_answer(normalized_question, cached_answer)
+                return cached_answer
+
         logger.info(f"Cache miss for question: '{question}'")
+        return None
+
+    async def answer_question(self, question: str, context: List[str]) -> AsyncIterator[str]:
+        """
+        Answer a question based on the provided context, streaming the answer
+        as it is generated.
+        Answers are cached for 1 hour by exact question text (in Redis when
+        REDIS_URL is set) and by question embedding in the vector store.
+        The caches are not consulted here; check cache_lookup before
+        retrieving context.
+        
+        Args:
+            question: The question to answer
+            context: List of relevant context documents
+            
+        Yields:
+            Successive fragments of the answer text
+        """
+        normalized_question = question.lower() # Normalize for caching
 
         if not context:
             logger.warning("No context provided for question answering")
             # Don't cache 'I don't know' answers due to lack of context
-            return {
-                "answer": "I don't have enough information to answer this question.",
-                "confidence": 0.0
-            }
+            yield "I don't have enough information to answer this question."
+            return
 
         try:
-            # Format the prompt
-            system_prompt = """You are a helpful assistant that answers questions about the Democratic Republic of Georgia (1918-1921). 
-            Use the provided context to answer the question. If you don't know the answer, say 'I don't know'.
-            
-            Your response should be in JSON format with two fields:
-            - answer: The answer to the question
-            - confidence: A confidence score between 0 and 1
-            
-            Example format:
-            {
-                "answer": "The answer to the question",
-                "confidence": 0.95
-            }
-            """
-            
+            # Format the prompt; the system prompt is a fixed prefix so it can be
+            # served from OpenAI's prompt cache, and only the user turn varies
             user_prompt = f"""Context: {' '.join(context)}
 
             Question: {question}"""
             
-            # Log the context being used (each section fully)
-            logger.debug(f"--- Context being sent to OpenAI ({len(context)} sections) ---")
-            for i, doc_section in enumerate(context):
-                logger.debug(f"Context Section [{i+1}/{len(context)}]:\n{doc_section}")
-            logger.debug("--- End of Context ---")
+            # Log the context being used (each section fully). Guarded so the
+            # section text is only formatted when debug logging is enabled.
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("--- Context being sent to OpenAI (%d sections) ---", len(context))
+                for i, doc_section in enumerate(context):
+                    logger.debug("Context Section [%d/%d]:\n%s", i + 1, len(context), doc_section)
+                logger.debug("--- End of Context ---")
             
-            # Get completion from OpenAI using the module directly
-            response = openai.ChatCompletion.create(
+            # Stream the completion from OpenAI
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.7,
-                response_format={"type": "json_object"}
+                stream=True
             )
             
-            # Parse the response
-            answer_text = response.choices[0].message.content
-            parsed_answer = Answer.model_validate_json(answer_text)
+            # Forward fragments as they arrive and keep them for the cache
+            answer_parts = []
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    answer_parts.append(content)
+                    yield content
             
-            result = {
-                "answer": parsed_answer.answer,
-                "confidence": parsed_answer.confidence
-            }
+            result = {"answer": "".join(answer_parts)}
             
             # Store successful result in cache
-            self.question_cache[normalized_question] = result
+            await self._store_cached_answer(normalized_question, result)
+            if self.vector_store is not None:
+                # Memoized since cache_lookup and retrieval embedded the question
+                question_embedding = await self.vector_store.get_question_embedding(question)
+                await self.vector_store.cache_answer(
+                    normalized_question,
+                    question_embedding,
+                    result,
+                    max_age_seconds=ANSWER_CACHE_TTL_SECONDS
+                )
             logger.info(f"Stored answer in cache for question: '{question}'")
-            
-            return result
         except Exception as e:
             logger.error(f"Failed to answer question: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
@@ -0,0 +1,4 @@
+import os
+
+# main creates its services at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
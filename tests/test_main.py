@@ -0,0 +1,26 @@
+import os
+
+from main import load_georgian_history
+
+
+def write_history(tmp_path, monkeypatch, content: bytes):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    with open("data/georgian_history.txt", "wb") as file:
+        file.write(content)
+
+
+def test_sections_split_on_blank_lines(tmp_path, monkeypatch):
+    write_history(tmp_path, monkeypatch, "პირველი\nხაზი\n\n\nმეორე\n".encode("utf-8"))
+    assert load_georgian_history() == ["პირველი\nხაზი", "მეორე"]
+
+
+def test_crlf_matches_lf(tmp_path, monkeypatch):
+    lf = "first\nline\n\nsecond\n\n\nthird"
+    write_history(tmp_path, monkeypatch, lf.replace("\n", "\r\n").encode("utf-8"))
+    assert load_georgian_history() == ["first\nline", "second", "third"]
+
+
+def test_empty_file(tmp_path, monkeypatch):
+    write_history(tmp_path, monkeypatch, b"")
+    assert load_georgian_history() == []
@@ -0,0 +1,321 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import orjson
+import pytest
+
+import vector_store
+from vector_store import EMBEDDING_DIMENSION, EmbeddingBatchInProgressError, VectorStore, _normalize, _point_id
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("EMBEDDINGS_PATH", str(tmp_path / "emb.npy"))
+    monkeypatch.setenv("CHUNKS_PATH", str(tmp_path / "chunks.json"))
+    monkeypatch.setenv("EMBEDDING_BATCH_PATH", str(tmp_path / "embedding_batch.json"))
+    monkeypatch.setenv("INDEXING_THRESHOLD_PATH", str(tmp_path / "indexing_threshold.json"))
+    return VectorStore
+
+
+def save(store, documents):
+    point_ids = [_point_id(document) for document in documents]
+    rng = np.random.default_rng(len(documents))
+    vectors = {
+        point_id: _normalize(rng.standard_normal(EMBEDDING_DIMENSION).tolist())
+        for point_id in point_ids
+    }
+    asyncio.run(store._save_local_embeddings(point_ids, documents, vectors))
+    return point_ids, vectors
+
+
+def test_save_and_reload(make_store):
+    store = make_store()
+    assert store.emb is None
+
+    point_ids, vectors = save(store, ["first", "second"])
+    reloaded = make_store()
+
+    assert isinstance(reloaded.emb, np.memmap)
+    assert reloaded.chunk_ids == point_ids
+    assert reloaded.chunk_texts == ["first", "second"]
+    assert np.allclose(reloaded.emb, [vectors[point_id] for point_id in point_ids])
+
+
+def test_refresh_picks_up_rebuild_by_another_process(make_store, tmp_path):
+    reader = make_store()
+    save(make_store(), ["first", "second"])
+    reader._refresh_local_embeddings()
+    assert reader.chunk_texts == ["first", "second"]
+
+    # Same number of sections, different contents
+    save(make_store(), ["first", "edited"])
+    os.utime(tmp_path / "chunks.json", ns=(0, os.stat(tmp_path / "chunks.json").st_mtime_ns + 1))
+    reader._refresh_local_embeddings()
+    assert reader.chunk_texts == ["first", "edited"]
+    assert reader.emb.shape == (2, EMBEDDING_DIMENSION)
+
+    # Only the current and the previous matrix are kept
+    save(make_store(), ["third"])
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("emb.")]) == 2
+
+
+def rebuild_repeatedly(worker):
+    store = VectorStore()
+    for i in range(20):
+        save(store, [f"worker {worker} section {i}"])
+
+
+def test_concurrent_rebuilds_leave_a_consistent_copy(make_store, tmp_path):
+    # Workers inherit the environment set up by make_store
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(rebuild_repeatedly, range(4)))
+
+    reloaded = make_store()
+    assert reloaded.emb is not None
+    assert len(reloaded.chunk_texts) == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_mismatched_manifest_is_rejected(make_store, tmp_path):
+    store = make_store()
+    save(store, ["first", "second"])
+    assert store.emb is not None
+
+    manifest_path = tmp_path / "chunks.json"
+    manifest = orjson.loads(manifest_path.read_bytes())
+    manifest["ids"].append(_point_id("third"))
+    manifest["texts"].append("third")
+    manifest_path.write_bytes(orjson.dumps(manifest))
+    os.utime(manifest_path, ns=(0, store._emb_mtime + 1))
+
+    store._refresh_local_embeddings()
+    assert store.emb is None
+    assert store.chunk_ids == []
+    assert store.chunk_texts == []
+    assert store._emb_mtime is None
+
+    # A consistent rebuild is picked up again
+    save(make_store(), ["first", "second", "third"])
+    os.utime(manifest_path, ns=(0, store._emb_rejected_mtime + 1))
+    store._refresh_local_embeddings()
+    assert store.chunk_texts == ["first", "second", "third"]
+
+
+def test_missing_matrix_is_rejected(make_store, tmp_path):
+    save(make_store(), ["first"])
+    for name in os.listdir(tmp_path):
+        if name.startswith("emb."):
+            os.remove(tmp_path / name)
+
+    store = make_store()
+    assert store.emb is None
+    assert store.chunk_ids == []
+
+
+class FakeBatchAPI:
+    """Batch job that completes after a few status checks."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.checks = 0
+        self.cancelled = []
+        self.requests = b""
+
+    async def create_file(self, file, purpose):
+        self.requests = file[1]
+        return SimpleNamespace(id="file-in")
+
+    async def create_batch(self, **kwargs):
+        self.submitted += 1
+        return self.batch()
+
+    async def retrieve_batch(self, batch_id):
+        assert batch_id == "batch-1"
+        self.checks += 1
+        return self.batch()
+
+    async def cancel_batch(self, batch_id):
+        self.cancelled.append(batch_id)
+
+    def batch(self):
+        done = self.checks >= 2
+        return SimpleNamespace(
+            id="batch-1",
+            status="completed" if done else "in_progress",
+            output_file_id="file-out" if done else None
+        )
+
+    async def content(self, file_id):
+        lines = []
+        for line in self.requests.splitlines():
+            request = orjson.loads(line)
+            embedding = [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1)
+            lines.append(orjson.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {"data": [{"embedding": embedding}]}}
+            }))
+        return SimpleNamespace(content=b"\n".join(lines))
+
+    def install(self, store):
+        store.openai_client = SimpleNamespace(
+            files=SimpleNamespace(create=self.create_file, content=self.content),
+            batches=SimpleNamespace(
+                create=self.create_batch,
+                retrieve=self.retrieve_batch,
+                cancel=self.cancel_batch
+            )
+        )
+
+
+def test_pending_batch_is_resumed_after_restart(make_store, monkeypatch):
+    monkeypatch.setattr(vector_store, "BATCH_POLL_INTERVAL_SECONDS", 0)
+    documents = [(_point_id(text), text) for text in ["first", "second"]]
+    api = FakeBatchAPI()
+
+    async def interrupted():
+        store = make_store()
+        api.install(store)
+        task = asyncio.create_task(store._embed_documents_with_batch_api(documents))
+        while not store.has_pending_embedding_batch():
+            await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(interrupted())
+
+    restarted = make_store()
+    assert restarted.has_pending_embedding_batch()
+    api.install(restarted)
+    embeddings = asyncio.run(restarted._embed_documents_with_batch_api(documents))
+
+    assert api.submitted == 1
+    assert len(embeddings) == 2
+
+
+def test_batch_job_is_owned_by_one_process(make_store):
+    owner = make_store()
+    assert owner._embedding_batch_lock.try_acquire()
+    other = make_store()
+
+    assert other.embedding_batch_in_progress()
+    with pytest.raises(EmbeddingBatchInProgressError):
+        asyncio.run(other.add_documents(["first"], use_batch_api=True))
+
+    owner._embedding_batch_lock.release()
+    assert not other.embedding_batch_in_progress()
+
+
+def test_pending_batch_is_cancelled_when_documents_are_already_stored(make_store):
+    documents = ["first", "second"]
+    vectors = {_point_id(text): [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1) for text in documents}
+    store = make_store()
+    store._save_pending_batch("batch-1", list(vectors))
+    # e.g. a synchronous rebuild after the process running the job crashed
+    store.qdrant_client = FakeQdrant(stored=vectors)
+    api = FakeBatchAPI()
+    api.install(store)
+
+    asyncio.run(store.add_documents(documents, use_batch_api=True))
+
+    assert api.cancelled == ["batch-1"]
+    assert api.submitted == 0
+    assert not store.has_pending_embedding_batch()
+    assert store.chunk_texts == documents
+
+
+def test_resume_cancels_batch_for_other_documents(make_store):
+    store = make_store()
+    store._save_pending_batch("batch-1", [_point_id("old section")])
+    store.qdrant_client = FakeQdrant()
+    api = FakeBatchAPI()
+    api.install(store)
+
+    asyncio.run(store.add_documents(["new section"], use_batch_api=True, resume_only=True))
+
+    assert api.cancelled == ["batch-1"]
+    assert api.submitted == 0
+    assert not store.has_pending_embedding_batch()
+
+
+class FakeQdrant:
+    """Collection that tracks its points and indexing threshold."""
+
+    def __init__(self, indexing_threshold=None, stored=None):
+        self.indexing_threshold = indexing_threshold
+        self.stored = stored or {}
+        self.thresholds = []
+        self.points = 0
+
+    async def get_collection(self, collection_name):
+        optimizer_config = SimpleNamespace(indexing_threshold=self.indexing_threshold)
+        return SimpleNamespace(config=SimpleNamespace(optimizer_config=optimizer_config))
+
+    async def update_collection(self, collection_name, optimizers_config):
+        self.indexing_threshold = optimizers_config.indexing_threshold
+        self.thresholds.append(self.indexing_threshold)
+
+    async def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        return [SimpleNamespace(id=point_id, vector=self.stored[point_id]) for point_id in ids if point_id in self.stored]
+
+    async def upsert(self, collection_name, points, wait):
+        await asyncio.sleep(0)
+        self.points += len(points)
+
+
+def bulk_points():
+    return [SimpleNamespace(id=i) for i in range(vector_store.UPSERT_BATCH_SIZE + 1)]
+
+
+def test_bulk_upserts_restore_the_collection_threshold(make_store):
+    qdrant = FakeQdrant(indexing_threshold=50000)
+    # Separate stores stand in for separate worker processes
+    stores = [make_store(), make_store()]
+    for store in stores:
+        store.qdrant_client = qdrant
+
+    async def ingest_concurrently():
+        await asyncio.gather(*[store._upsert_points(bulk_points()) for store in stores])
+
+    asyncio.run(ingest_concurrently())
+
+    assert qdrant.points == 2 * len(bulk_points())
+    assert qdrant.thresholds == [0, 50000, 0, 50000]
+    assert not os.path.exists(stores[0].indexing_threshold_path)
+
+
+def test_disabled_indexing_stays_disabled(make_store):
+    store = make_store()
+    store.qdrant_client = FakeQdrant(indexing_threshold=0)
+
+    asyncio.run(store._upsert_points(bulk_points()))
+
+    assert store.qdrant_client.thresholds == [0, 0]
+
+
+def test_threshold_of_interrupted_ingest_is_restored(make_store):
+    # An ingest was killed while indexing was paused
+    store = make_store()
+    with open(store.indexing_threshold_path, "wb") as file:
+        file.write(orjson.dumps({"collection_name": store.collection_name, "indexing_threshold": 50000}))
+    store.qdrant_client = FakeQdrant(indexing_threshold=0)
+
+    asyncio.run(store._upsert_points(bulk_points()))
+
+    assert store.qdrant_client.thresholds == [0, 50000]
+    assert not os.path.exists(store.indexing_threshold_path)
+
+
+def test_answer_cache_errors_are_ignored(make_store):
+    store = make_store()
+
+    async def unavailable(**kwargs):
+        raise ConnectionError("Qdrant went away")
+
+    store.qdrant_client = SimpleNamespace(search=unavailable, upsert=unavailable, delete=unavailable)
+    embedding = _normalize([1.0] * EMBEDDING_DIMENSION)
+
+    assert asyncio.run(store.find_cached_answer(embedding, score_threshold=0.98, max_age_seconds=60)) is None
+    asyncio.run(store.cache_answer("question", embedding, {"answer": "answer"}, max_age_seconds=60))
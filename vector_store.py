@@ -1,17 +1,230 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import os
+import asyncio
 import openai
-from qdrant_client import QdrantClient
+import httpx
+import numpy as np
+import orjson
+import simsimd
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.models import Distance, VectorParams
 from dotenv import load_dotenv
 import logging
 import hashlib
+import time
+import tempfile
+from cachetools import TTLCache
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Number of documents sent to the embeddings endpoint per request
+EMBEDDING_BATCH_SIZE = 96
+
+# Maximum number of embedding requests in flight, to stay under OpenAI rate limits
+MAX_CONCURRENT_EMBEDDING_REQUESTS = 8
+
+# Number of points sent to Qdrant per upsert request
+UPSERT_BATCH_SIZE = 256
+
+# Qdrant's default indexing threshold, restored after bulk ingestion when
+# the collection config doesn't report one
+INDEXING_THRESHOLD = 20000
+
+# Seconds between status checks of an OpenAI batch embedding job
+BATCH_POLL_INTERVAL_SECONDS = 60
+
+# Largest corpus searched exactly in-process instead of through Qdrant
+BRUTE_FORCE_MAX_DOCUMENTS = 10_000
+
+# Connection pool limits of the shared OpenAI HTTP client
+OPENAI_MAX_CONNECTIONS = 100
+
+# OpenAI embedding dimension
+EMBEDDING_DIMENSION = 1536
+
+# Number of recent queries kept in the in-memory search cache
+SEARCH_CACHE_SIZE = 512
+
+# Maximum cosine distance for a cached query to be reused
+SEARCH_CACHE_DISTANCE_THRESHOLD = 0.05
+
+# Seconds between deletions of expired answer cache points
+ANSWER_CACHE_PURGE_INTERVAL_SECONDS = 600
+
+# Lifetime of search cache entries. Upserts clear this process's cache, but
+# another worker's ingest is only picked up once its entries expire
+SEARCH_CACHE_TTL_SECONDS = 300
+
+# Seconds between attempts to take a lock file held by another process
+FILE_LOCK_POLL_INTERVAL_SECONDS = 0.1
+
+def create_openai_client(api_key: str) -> openai.AsyncOpenAI:
+    """
+    Create an AsyncOpenAI client backed by a pooled HTTP/2 connection.
+    Concurrent requests reuse kept-alive connections and are multiplexed
+    over them instead of each paying for a TCP/TLS handshake.
+    
+    Args:
+        api_key: OpenAI API key
+        
+    Returns:
+        The configured client
+    """
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+            ),
+            http2=True
+        )
+    )
+
+def _quantize(embedding: List[float]) -> np.ndarray:
+    """
+    Scale an embedding to int8 for SimSIMD distance computations.
+    Cosine distance is scale invariant, so each vector uses its own scale.
+    
+    Args:
+        embedding: The embedding to quantize
+        
+    Returns:
+        int8 array of the same dimension
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    return np.round(vector / np.abs(vector).max() * 127).astype(np.int8)
+
+def _point_id(document: str) -> int:
+    """
+    Generate a content-based point ID for a document.
+    
+    Args:
+        document: The document text
+        
+    Returns:
+        SHA-256 of the text as a positive 64-bit integer
+    """
+    hasher = hashlib.sha256(document.encode('utf-8'))
+    # Convert hex hash to integer and fit into positive 64-bit range
+    return int(hasher.hexdigest(), 16) % (2**63)
+
+def _normalize(embedding: List[float]) -> List[float]:
+    """
+    Scale an embedding to unit length so dot product equals cosine similarity.
+    
+    Args:
+        embedding: The embedding to normalize
+        
+    Returns:
+        The L2-normalized embedding
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+def _write_atomically(path: str, data: bytes) -> None:
+    """
+    Replace a file in one step. The data goes to a uniquely named temporary
+    file in the same directory first, so concurrent writers never rename
+    each other's partial output.
+    
+    Args:
+        path: File to replace
+        data: New contents
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+class _FileLock:
+    """
+    Exclusive lock shared by all processes on this host through a lock file.
+    The OS releases it if the holding process dies, so it can't go stale.
+    Used as an async context manager it waits for the lock, also queueing
+    coroutines of the same process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._local_lock = asyncio.Lock()
+
+    def try_acquire(self) -> bool:
+        """
+        Take the lock if nobody holds it.
+        
+        Returns:
+            Whether the lock was taken
+        """
+        if self._file is not None:
+            return False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        file = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.close()
+            return False
+        self._file = file
+        return True
+
+    def release(self) -> None:
+        """
+        Release the lock if this process holds it.
+        """
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    async def __aenter__(self) -> "_FileLock":
+        await self._local_lock.acquire()
+        try:
+            while not self.try_acquire():
+                await asyncio.sleep(FILE_LOCK_POLL_INTERVAL_SECONDS)
+        except BaseException:
+            self._local_lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+        self._local_lock.release()
+
+class EmbeddingBatchInProgressError(RuntimeError):
+    """
+    Raised when another process is already running the embedding batch job.
+    """
+
 class VectorStore:
     def __init__(self):
         try:
@@ -20,106 +233,666 @@ class VectorStore:
             if not api_key:
                 raise ValueError("OPENAI_API_KEY environment variable is not set")
             
-            # Set the API key for the openai module
-            openai.api_key = api_key
+            # Initialize OpenAI client
+            self.openai_client = create_openai_client(api_key)
             
             # Initialize Qdrant client
-            self.qdrant_client = QdrantClient(
+            self.qdrant_client = AsyncQdrantClient(
                 url=os.getenv("QDRANT_URL", "http://localhost:6333"),
                 prefer_grpc=True
             )
             self.collection_name = os.getenv("QDRANT_COLLECTION_NAME", "documents")
-            self._ensure_collection_exists()
+            # Collection holding embeddings of answered questions
+            self.answer_cache_collection_name = os.getenv("QDRANT_ANSWER_CACHE_COLLECTION_NAME", "answer_cache")
+
+            self._answer_cache_purged_at = 0.0 # time.monotonic() of the last purge
+
+            # Bulk ingests pause indexing on the collection. They take turns
+            # across processes, and the original threshold is kept on disk
+            # until it is restored, so an interrupted ingest can't lose it
+            self.indexing_threshold_path = os.getenv("INDEXING_THRESHOLD_PATH", "data/indexing_threshold.json")
+            self._bulk_upsert_lock = _FileLock(self.indexing_threshold_path + ".lock")
+
+            # Question embeddings, so one question is only embedded once
+            self._embedding_cache = TTLCache(maxsize=1024, ttl=3600)
+
+            # Approximate search cache: int8-quantized query embeddings stacked
+            # row-wise, with the (k, results) of the search for each row
+            self._cache_keys = np.zeros((SEARCH_CACHE_SIZE, EMBEDDING_DIMENSION), dtype=np.int8)
+            self._cache_results: List[Tuple[int, List[str]]] = []
+            self._cache_inserted_at = np.zeros(SEARCH_CACHE_SIZE) # time.monotonic() per row
+            self._cache_next = 0 # Next row to overwrite (FIFO eviction)
+
+            # Local copy of the corpus embeddings: a normalized float32 matrix
+            # memory-mapped from disk, with the point ID and text of each row.
+            # chunks.json is the manifest naming the matrix generation to use;
+            # each rebuild writes a new matrix file and swaps the manifest last
+            self.embeddings_path = os.getenv("EMBEDDINGS_PATH", "data/emb.npy")
+            self.chunks_path = os.getenv("CHUNKS_PATH", "data/chunks.json")
+            self.emb: Optional[np.ndarray] = None
+            self.chunk_ids: List[int] = []
+            self.chunk_texts: List[str] = []
+            self._local_embeddings_lock = _FileLock(self.chunks_path + ".lock") # Serializes rewrites across processes
+            self._emb_mtime: Optional[int] = None # Manifest mtime of the loaded copy
+            self._emb_rejected_mtime: Optional[int] = None # Manifest mtime of the last rejected load
+            self._load_local_embeddings()
+
+            # Submitted OpenAI batch job that hasn't been stored yet, so a
+            # restarted process resumes it instead of submitting another
+            self.embedding_batch_path = os.getenv("EMBEDDING_BATCH_PATH", "data/embedding_batch.json")
+            # Held by the one process running the batch job
+            self._embedding_batch_lock = _FileLock(self.embedding_batch_path + ".lock")
         except Exception as e:
             logger.error(f"Failed to initialize VectorStore: {str(e)}")
             raise
 
-    def _ensure_collection_exists(self) -> None:
+    async def initialize(self) -> None:
+        """
+        Create the Qdrant collections if they don't exist yet.
+        Must be awaited once before the store is used.
+        """
+        await self._ensure_collection_exists(self.collection_name)
+        await self._ensure_collection_exists(self.answer_cache_collection_name)
+
+    async def _ensure_collection_exists(self, collection_name: str) -> None:
         """
-        Ensure the Qdrant collection exists.
+        Ensure a Qdrant collection exists.
+        
+        Args:
+            collection_name: Name of the collection to create if missing
         """
         try:
             # Try to get the collection first
             try:
-                self.qdrant_client.get_collection(self.collection_name)
-                logger.info(f"Collection {self.collection_name} already exists")
+                await self.qdrant_client.get_collection(collection_name)
+                logger.info(f"Collection {collection_name} already exists")
                 return
             except Exception:
                 # Collection doesn't exist, create it
                 pass
 
-            # Create collection with default parameters
-            self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
+            # Create collection; embeddings are normalized on insert and
+            # query, so dot product gives cosine similarity without the
+            # per-search renormalization of Distance.COSINE
+            await self.qdrant_client.create_collection(
+                collection_name=collection_name,
                 vectors_config=VectorParams(
-                    size=1536,  # OpenAI embedding dimension
-                    distance=Distance.COSINE
+                    size=EMBEDDING_DIMENSION,
+                    distance=Distance.DOT
+                ),
+                # Keep int8 copies of the vectors in RAM for search, which
+                # moves a quarter of the bytes per candidate of float32
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        always_ram=True
+                    )
                 )
             )
-            logger.info(f"Created new collection {self.collection_name}")
+            logger.info(f"Created new collection {collection_name}")
         except Exception as e:
             if "already exists" in str(e):
-                logger.info(f"Collection {self.collection_name} already exists")
+                logger.info(f"Collection {collection_name} already exists")
                 return
             logger.error(f"Failed to ensure collection exists: {str(e)}")
             raise
 
-    def add_documents(self, documents: List[str]) -> None:
+    async def _embed_batch(self, batch: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """
+        Generate embeddings for a batch of documents in one request.
+        
+        Args:
+            batch: Document texts to embed
+            semaphore: Limits the number of concurrent requests
+            
+        Returns:
+            L2-normalized embeddings in the same order as the batch
+        """
+        async with semaphore:
+            response = await self.openai_client.embeddings.create(
+                model="text-embedding-ada-002",
+                input=batch
+            )
+        # Results carry an index; sort to keep them aligned with the batch
+        return [_normalize(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings through the synchronous embeddings endpoint.
+        
+        Args:
+            documents: Document texts to embed
+            
+        Returns:
+            L2-normalized embeddings in the same order as the documents
+        """
+        # Embed documents in batches, with several batches in flight at once
+        batches = [
+            documents[start:start + EMBEDDING_BATCH_SIZE]
+            for start in range(0, len(documents), EMBEDDING_BATCH_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMBEDDING_REQUESTS)
+        batch_embeddings = await asyncio.gather(
+            *[self._embed_batch(batch, semaphore) for batch in batches]
+        )
+        return [embedding for embeddings in batch_embeddings for embedding in embeddings]
+
+    async def _embed_documents_with_batch_api(self, documents: List[Tuple[int, str]]) -> List[List[float]]:
+        """
+        Generate embeddings through the OpenAI Batch API.
+        Batch jobs cost half as much and don't count against the synchronous
+        rate limits, but may take up to 24 hours to complete.
+        
+        Args:
+            documents: (point ID, text) pairs of documents to embed
+            
+        Returns:
+            L2-normalized embeddings in the same order as the documents
+        """
+        # One embeddings request per document, identified by its point ID
+        requests = b"\n".join(
+            orjson.dumps({
+                "custom_id": str(point_id),
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": "text-embedding-ada-002", "input": doc}
+            })
+            for point_id, doc in documents
+        )
+        point_ids = [point_id for point_id, _ in documents]
+        pending = self._load_pending_batch()
+        if pending and sorted(pending["ids"]) == sorted(point_ids):
+            batch = await self.openai_client.batches.retrieve(pending["batch_id"])
+            logger.info(f"Resuming embedding batch {batch.id} for {len(documents)} documents")
+        else:
+            input_file = await self.openai_client.files.create(
+                file=("embeddings.jsonl", requests),
+                purpose="batch"
+            )
+            batch = await self.openai_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/embeddings",
+                completion_window="24h"
+            )
+            self._save_pending_batch(batch.id, point_ids)
+            logger.info(f"Submitted embedding batch {batch.id} for {len(documents)} documents")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+            batch = await self.openai_client.batches.retrieve(batch.id)
+            logger.debug(f"Embedding batch {batch.id} status: {batch.status}")
+        if batch.status != "completed" or not batch.output_file_id:
+            self._clear_pending_batch()
+            raise RuntimeError(f"Embedding batch {batch.id} finished with status {batch.status}")
+
+        # Results are not ordered; match them back to documents by custom_id
+        output = await self.openai_client.files.content(batch.output_file_id)
+        embeddings: Dict[str, List[float]] = {}
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            response = result.get("response")
+            if response and response["status_code"] == 200:
+                embeddings[result["custom_id"]] = _normalize(response["body"]["data"][0]["embedding"])
+
+        missing = [point_id for point_id, _ in documents if str(point_id) not in embeddings]
+        if missing:
+            self._clear_pending_batch()
+            raise RuntimeError(f"Embedding batch {batch.id} returned no embedding for {len(missing)} documents")
+        logger.info(f"Embedding batch {batch.id} completed")
+        return [embeddings[str(point_id)] for point_id, _ in documents]
+
+    def has_pending_embedding_batch(self) -> bool:
+        """
+        Whether a submitted embedding batch job hasn't been stored yet.
+        """
+        return os.path.exists(self.embedding_batch_path)
+
+    def embedding_batch_in_progress(self) -> bool:
+        """
+        Whether a batch job is pending or some process is about to submit one.
+        """
+        if self.has_pending_embedding_batch() or not self._embedding_batch_lock.try_acquire():
+            return True
+        self._embedding_batch_lock.release()
+        return False
+
+    def _load_pending_batch(self) -> Optional[Dict[str, Any]]:
+        """
+        Read the submitted embedding batch job, if any.
+        
+        Returns:
+            The batch ID and the point IDs it embeds, or None
+        """
+        try:
+            with open(self.embedding_batch_path, "rb") as file:
+                return orjson.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {self.embedding_batch_path}: {str(e)}")
+            return None
+
+    def _save_pending_batch(self, batch_id: str, point_ids: List[int]) -> None:
+        """
+        Record a submitted embedding batch job until its results are stored.
+        """
+        _write_atomically(self.embedding_batch_path, orjson.dumps({"batch_id": batch_id, "ids": point_ids}))
+
+    async def _cancel_pending_batch(self, batch_id: str) -> None:
+        """
+        Cancel a submitted embedding batch job that is no longer needed, so
+        it isn't billed, and forget it.
+        
+        Args:
+            batch_id: ID of the batch job
+        """
+        try:
+            await self.openai_client.batches.cancel(batch_id)
+            logger.info(f"Cancelled embedding batch {batch_id}")
+        except Exception as e:
+            # Usually the job has already finished
+            logger.warning(f"Failed to cancel embedding batch {batch_id}: {str(e)}")
+        self._clear_pending_batch()
+
+    def _clear_pending_batch(self) -> None:
+        """
+        Forget the submitted embedding batch job once it is finished.
+        """
+        try:
+            os.remove(self.embedding_batch_path)
+        except FileNotFoundError:
+            pass
+
+    async def _upsert_new_documents(self, new_documents: List[Tuple[int, str]],
+                                    use_batch_api: bool = False) -> Dict[int, List[float]]:
+        """
+        Embed documents and upsert them to Qdrant.
+        
+        Args:
+            new_documents: (point ID, text) pairs of documents to add
+            use_batch_api: Embed through the OpenAI Batch API instead of the
+                synchronous endpoint
+            
+        Returns:
+            The embedding of each added document by point ID
+        """
+        if use_batch_api:
+            embeddings = await self._embed_documents_with_batch_api(new_documents)
+        else:
+            embeddings = await self._embed_documents([doc for _, doc in new_documents])
+
+        points_to_upsert = []
+        for (point_id, doc), embedding in zip(new_documents, embeddings):
+            # Prepare point for Qdrant
+            point = models.PointStruct(
+                id=point_id, # Use the hash-based ID
+                vector=embedding,
+                payload={"text": doc}
+            )
+            points_to_upsert.append(point)
+
+        # Upload points to Qdrant
+        await self._upsert_points(points_to_upsert)
+        if use_batch_api:
+            self._clear_pending_batch()
+        # Cached search results may no longer reflect the collection
+        self._clear_search_cache()
+        return {point.id: point.vector for point in points_to_upsert}
+
+    async def _upsert_points(self, points: List[models.PointStruct]) -> None:
+        """
+        Upsert points in chunks without waiting for each to be applied.
+        Large uploads pause HNSW indexing until all points are in, so the
+        index is built once instead of repeatedly during ingestion.
+        
+        Args:
+            points: Points to upsert
+        """
+        chunks = [
+            points[start:start + UPSERT_BATCH_SIZE]
+            for start in range(0, len(points), UPSERT_BATCH_SIZE)
+        ]
+        if len(chunks) == 1:
+            await self.qdrant_client.upsert(
+                collection_name=self.collection_name,
+                points=chunks[0],
+                wait=True # Wait for operation to complete
+            )
+            return
+
+        async with self._bulk_upsert_lock:
+            # Restore the threshold the collection had before any ingest paused
+            # it, which an interrupted ingest leaves recorded
+            indexing_threshold = self._load_saved_indexing_threshold()
+            if indexing_threshold is None:
+                collection = await self.qdrant_client.get_collection(self.collection_name)
+                indexing_threshold = collection.config.optimizer_config.indexing_threshold
+                if indexing_threshold is None:
+                    indexing_threshold = INDEXING_THRESHOLD
+                _write_atomically(self.indexing_threshold_path, orjson.dumps({
+                    "collection_name": self.collection_name,
+                    "indexing_threshold": indexing_threshold
+                }))
+            await self.qdrant_client.update_collection(
+                collection_name=self.collection_name,
+                optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0)
+            )
+            try:
+                # All but the last chunk are acknowledged once written to the
+                # WAL; operations are applied in order, so waiting for the
+                # last one means all of them have been applied
+                await asyncio.gather(*[
+                    self.qdrant_client.upsert(
+                        collection_name=self.collection_name,
+                        points=chunk,
+                        wait=False
+                    )
+                    for chunk in chunks[:-1]
+                ])
+                await self.qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=chunks[-1],
+                    wait=True # Wait for operation to complete
+                )
+            finally:
+                await self.qdrant_client.update_collection(
+                    collection_name=self.collection_name,
+                    optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+                )
+                os.remove(self.indexing_threshold_path)
+
+    def _load_saved_indexing_threshold(self) -> Optional[int]:
+        """
+        Read the original indexing threshold recorded by an ingest that
+        didn't get to restore it.
+        
+        Returns:
+            The threshold, or None if nothing is recorded for this collection
+        """
+        try:
+            with open(self.indexing_threshold_path, "rb") as file:
+                saved = orjson.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {self.indexing_threshold_path}: {str(e)}")
+            return None
+        if saved.get("collection_name") != self.collection_name:
+            return None
+        logger.info(f"Restoring indexing threshold {saved['indexing_threshold']} left by an interrupted ingest")
+        return saved["indexing_threshold"]
+
+    def _matrix_path(self, generation: int) -> str:
+        """
+        Path of the embedding matrix written by a given rebuild.
+        """
+        root, ext = os.path.splitext(self.embeddings_path)
+        return f"{root}.{generation}{ext}"
+
+    def _unload_local_embeddings(self) -> None:
+        """
+        Drop the local copy so searches fall back to Qdrant.
+        """
+        self.emb = None
+        self.chunk_ids = []
+        self.chunk_texts = []
+        self._emb_mtime = None
+
+    def _load_local_embeddings(self) -> None:
+        """
+        Memory-map the saved embedding matrix and load its chunk texts.
+        Leaves the local copy empty if the files are missing or inconsistent.
+        """
+        try:
+            mtime = os.stat(self.chunks_path).st_mtime_ns
+        except OSError:
+            logger.info("No saved embeddings found; they are written by the next embeddings rebuild")
+            self._unload_local_embeddings()
+            return
+
+        try:
+            with open(self.chunks_path, "rb") as file:
+                manifest = orjson.loads(file.read())
+            chunk_ids = [int(point_id) for point_id in manifest["ids"]]
+            chunk_texts = manifest["texts"]
+            matrix_path = self._matrix_path(manifest["generation"])
+            emb = np.load(matrix_path, mmap_mode="r")
+            if len(chunk_texts) != len(chunk_ids) or emb.shape != (len(chunk_ids), EMBEDDING_DIMENSION):
+                raise ValueError(
+                    f"{matrix_path} has shape {emb.shape} but the manifest lists "
+                    f"{len(chunk_ids)} IDs and {len(chunk_texts)} texts"
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring saved embeddings in {self.chunks_path}: {str(e)}")
+            self._unload_local_embeddings()
+            self._emb_rejected_mtime = mtime
+            return
+
+        self.emb = emb
+        self.chunk_ids = chunk_ids
+        self.chunk_texts = chunk_texts
+        self._emb_mtime = mtime
+        logger.info(f"Loaded {len(self.chunk_ids)} saved embeddings from {matrix_path}")
+
+    def _refresh_local_embeddings(self) -> None:
+        """
+        Reload the saved embeddings if another process has rewritten them.
+        """
+        try:
+            mtime = os.stat(self.chunks_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._emb_mtime and mtime != self._emb_rejected_mtime:
+            self._load_local_embeddings()
+            self._clear_search_cache()
+
+    def _local_search(self, query_embedding: List[float], k: int) -> List[str]:
+        """
+        Exact nearest-neighbour search over the memory-mapped embeddings.
+        
+        Args:
+            query_embedding: L2-normalized query embedding
+            k: Number of results to return
+            
+        Returns:
+            Texts of the k most similar chunks, most similar first
+        """
+        # Rows and query are normalized, so dot product is cosine similarity
+        scores = self.emb @ np.asarray(query_embedding, dtype=np.float32)
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [self.chunk_texts[i] for i in top]
+
+    async def _save_local_embeddings(self, point_ids: List[int], documents: List[str],
+                                     new_vectors: Dict[int, List[float]]) -> None:
+        """
+        Write the embedding matrix and chunk texts of the corpus to disk and
+        memory-map the result. Does nothing if the saved copy already holds
+        exactly these documents.
+        
+        Args:
+            point_ids: Content-based ID of each document
+            documents: The corpus documents
+            new_vectors: Embeddings of documents that were just added, by ID
+        """
+        chunks = dict(zip(point_ids, documents))
+        if list(chunks) == self.chunk_ids:
+            return
+
+        # Reuse vectors from the current file where possible and fetch the
+        # rest from Qdrant
+        vectors = dict(new_vectors)
+        local_rows = {point_id: row for row, point_id in enumerate(self.chunk_ids)}
+        for point_id in chunks:
+            if point_id not in vectors and point_id in local_rows:
+                vectors[point_id] = self.emb[local_rows[point_id]]
+        missing_ids = [point_id for point_id in chunks if point_id not in vectors]
+        if missing_ids:
+            stored_points = await self.qdrant_client.retrieve(
+                collection_name=self.collection_name,
+                ids=missing_ids,
+                with_payload=False,
+                with_vectors=True
+            )
+            vectors.update((point.id, point.vector) for point in stored_points)
+
+        emb = np.stack([np.asarray(vectors[point_id], dtype=np.float32) for point_id in chunks])
+
+        # Write the matrix under a new generation, then swap in the manifest
+        # that points to it. Readers see either the old pair or the new one,
+        # never a matrix with another generation's texts. Writers take turns,
+        # so no one deletes a matrix another is about to publish.
+        async with self._local_embeddings_lock:
+            previous_generation = self._current_generation()
+            generation = time.time_ns()
+            matrix_path = self._matrix_path(generation)
+            os.makedirs(os.path.dirname(matrix_path) or ".", exist_ok=True)
+            with open(matrix_path, "wb") as file:
+                np.save(file, emb)
+            _write_atomically(self.chunks_path, orjson.dumps({
+                "generation": generation,
+                "ids": list(chunks),
+                "texts": list(chunks.values())
+            }))
+            logger.info(f"Saved {len(chunks)} embeddings to {matrix_path}")
+
+            self._remove_old_matrices(keep={generation, previous_generation})
+        self._load_local_embeddings()
+
+    def _current_generation(self) -> Optional[int]:
+        """
+        Generation named by the saved manifest, if it is readable.
+        """
+        try:
+            with open(self.chunks_path, "rb") as file:
+                return int(orjson.loads(file.read())["generation"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _remove_old_matrices(self, keep: set) -> None:
+        """
+        Delete matrix files of other generations, including ones left
+        half-written by an interrupted rebuild.
+        
+        Args:
+            keep: Generations still in use: the new one, and the previous
+                one for processes still switching over
+        """
+        root, ext = os.path.splitext(self.embeddings_path)
+        directory = os.path.dirname(root) or "."
+        prefix = os.path.basename(root) + "."
+        generations = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(ext):
+                generation = name[len(prefix):len(name) - len(ext)]
+                if generation.isdigit():
+                    generations.append(int(generation))
+        for generation in generations:
+            if generation in keep:
+                continue
+            try:
+                os.remove(self._matrix_path(generation))
+            except OSError as e:
+                logger.warning(f"Failed to remove old embeddings {self._matrix_path(generation)}: {str(e)}")
+
+    async def add_documents(self, documents: List[str], use_batch_api: bool = False,
+                            resume_only: bool = False) -> None:
         """
         Add documents to the vector store with their embeddings.
         Uses content-based hashing for IDs to support idempotent updates.
         
         Args:
             documents: List of document texts to add
+            use_batch_api: Embed new documents through the OpenAI Batch API,
+                which is cheaper but can take up to 24 hours
+            resume_only: With use_batch_api, only finish a pending batch job
+                for these documents; never submit a new one
+        
+        Raises:
+            EmbeddingBatchInProgressError: With use_batch_api, if another
+                process is running the batch job
+        """
+        if not use_batch_api:
+            await self._add_documents(documents)
+            return
+
+        # One process owns the batch job and its pending marker at a time
+        if not self._embedding_batch_lock.try_acquire():
+            raise EmbeddingBatchInProgressError("The embedding batch job is being run by another process")
+        try:
+            await self._add_documents(documents, use_batch_api=True, resume_only=resume_only)
+        finally:
+            self._embedding_batch_lock.release()
+
+    async def _add_documents(self, documents: List[str], use_batch_api: bool = False,
+                             resume_only: bool = False) -> None:
+        """
+        Add documents as described in add_documents, which holds the batch
+        job lock when use_batch_api is set.
         """
         if not documents:
             logger.warning("No documents provided to add_documents")
             return
 
         try:
-            points_to_upsert = []
-            # Process documents in batches for embedding generation if needed (optional optimization)
-            # For simplicity here, we process one by one
-            for doc in documents:
-                if not doc.strip(): # Skip empty documents
-                    continue
-                    
-                # Generate embedding
-                response = openai.Embedding.create(
-                    model="text-embedding-ada-002",
-                    input=doc
-                )
-                embedding = response.data[0].embedding
-                
-                # Generate content-based ID using SHA-256 hash
-                hasher = hashlib.sha256(doc.encode('utf-8'))
-                # Convert hex hash to integer and fit into positive 64-bit range
-                point_id = int(hasher.hexdigest(), 16) % (2**63)
-                
-                # Prepare point for Qdrant
-                point = models.PointStruct(
-                    id=point_id, # Use the hash-based ID
-                    vector=embedding,
-                    payload={"text": doc}
-                )
-                points_to_upsert.append(point)
-            
-            if not points_to_upsert:
+            # Skip empty documents
+            documents = [doc for doc in documents if doc.strip()]
+            if not documents:
                 logger.info("No valid documents found to add/update.")
                 return
 
-            # Upload points to Qdrant
-            self.qdrant_client.upsert(
+            # Identical sections share a content-based ID; keep one of each
+            # so repeated text is embedded only once
+            point_ids = [_point_id(doc) for doc in documents]
+            unique_documents = dict(zip(point_ids, documents))
+
+            # Skip documents whose content-based ID is already stored
+            existing_points = await self.qdrant_client.retrieve(
                 collection_name=self.collection_name,
-                points=points_to_upsert,
-                wait=True # Wait for operation to complete
+                ids=list(unique_documents),
+                with_payload=False,
+                with_vectors=False
             )
-            logger.info(f"Successfully upserted {len(points_to_upsert)} documents to vector store using content-based IDs")
+            existing_ids = {point.id for point in existing_points}
+            new_documents = [
+                (point_id, doc) for point_id, doc in unique_documents.items()
+                if point_id not in existing_ids
+            ]
+
+            if use_batch_api:
+                # A pending job for other documents is stale: the corpus
+                # changed, or its documents were stored some other way
+                pending = self._load_pending_batch()
+                if pending and sorted(pending["ids"]) != sorted(point_id for point_id, _ in new_documents):
+                    logger.info(f"Embedding batch {pending['batch_id']} no longer matches the documents to add")
+                    await self._cancel_pending_batch(pending["batch_id"])
+                    pending = None
+                if resume_only and pending is None:
+                    logger.info("No embedding batch to resume")
+                    return
+
+            new_vectors: Dict[int, List[float]] = {}
+            if new_documents:
+                new_vectors = await self._upsert_new_documents(new_documents, use_batch_api)
+                logger.info(
+                    f"Successfully upserted {len(new_vectors)} documents to vector store using content-based IDs "
+                    f"({len(existing_ids)} already present)"
+                )
+            else:
+                logger.info(f"All {len(documents)} documents are already in the vector store")
+
+            # Keep the local embedding matrix in sync with the corpus
+            await self._save_local_embeddings(point_ids, documents, new_vectors)
         except Exception as e:
             logger.error(f"Failed to add documents: {str(e)}")
             raise
 
-    def similarity_search(self, query: str, k: int = 5) -> List[str]:
+    async def similarity_search(self, query: str, k: int = 5) -> List[str]:
         """
         Search for similar documents to the query.
         
@@ -132,41 +905,200 @@ class VectorStore:
         """
         try:
             # Generate embedding for the query
-            response = openai.Embedding.create(
-                model="text-embedding-ada-002",
-                input=query
-            )
-            query_embedding = response.data[0].embedding
-            
-            # Search in Qdrant
-            search_result = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=k
-            )
-            
-            # Extract text from results
-            return [hit.payload["text"] for hit in search_result]
+            query_embedding = await self.get_question_embedding(query)
+            query_key = _quantize(query_embedding)
+
+            # Pick up embeddings rebuilt by another process; this also clears
+            # search results cached against the old corpus
+            self._refresh_local_embeddings()
+
+            # Reuse results of a near-identical earlier query
+            cached_results = self._search_cache_lookup(query_key, k)
+            if cached_results is not None:
+                logger.debug("Search cache hit")
+                return cached_results
+
+            # Small corpora are searched exactly in-process, which avoids the
+            # Qdrant round-trip; larger ones go through Qdrant's index
+            if self.emb is not None and len(self.emb) < BRUTE_FORCE_MAX_DOCUMENTS:
+                results = self._local_search(query_embedding, k)
+            else:
+                search_result = await self.qdrant_client.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_embedding,
+                    limit=k
+                )
+                
+                # Extract text from results
+                results = [hit.payload["text"] for hit in search_result]
+            self._search_cache_insert(query_key, k, results)
+            return results
         except Exception as e:
             logger.error(f"Failed to perform similarity search: {str(e)}")
             raise
 
-    def get_question_embedding(self, question: str) -> List[float]:
+    def _search_cache_lookup(self, query_key: np.ndarray, k: int) -> Optional[List[str]]:
+        """
+        Find unexpired cached results for a query within the distance threshold.
+        
+        Args:
+            query_key: int8-quantized query embedding
+            k: Number of results requested
+            
+        Returns:
+            Cached document texts, or None on a miss
+        """
+        size = len(self._cache_results)
+        if not size:
+            return None
+
+        # One SIMD pass computes the cosine distance to every cached key
+        distances = np.asarray(
+            simsimd.cdist(query_key[None, :], self._cache_keys[:size], metric="cosine")
+        )[0]
+        expired = self._cache_inserted_at[:size] < time.monotonic() - SEARCH_CACHE_TTL_SECONDS
+        distances[expired] = np.inf
+        best = int(np.argmin(distances))
+        cached_k, results = self._cache_results[best]
+        if distances[best] <= SEARCH_CACHE_DISTANCE_THRESHOLD and cached_k == k:
+            return results
+        return None
+
+    def _search_cache_insert(self, query_key: np.ndarray, k: int, results: List[str]) -> None:
+        """
+        Store search results, evicting the oldest entry when the cache is full.
+        
+        Args:
+            query_key: int8-quantized query embedding
+            k: Number of results requested
+            results: Document texts returned for the query
+        """
+        row = self._cache_next
+        self._cache_keys[row] = query_key
+        self._cache_inserted_at[row] = time.monotonic()
+        if row < len(self._cache_results):
+            self._cache_results[row] = (k, results)
+        else:
+            self._cache_results.append((k, results))
+        self._cache_next = (row + 1) % SEARCH_CACHE_SIZE
+
+    def _clear_search_cache(self) -> None:
+        """
+        Drop all cached search results.
+        """
+        self._cache_results = []
+        self._cache_next = 0
+
+    async def get_question_embedding(self, question: str) -> List[float]:
         """
         Generate embedding for a question.
+        Recently embedded questions are served from an in-memory TTL cache.
         
         Args:
             question: The question text
             
         Returns:
-            List of floats representing the embedding
+            List of floats representing the L2-normalized embedding
         """
+        if question in self._embedding_cache:
+            return self._embedding_cache[question]
+
         try:
-            response = openai.Embedding.create(
+            response = await self.openai_client.embeddings.create(
                 model="text-embedding-ada-002",
                 input=question
             )
-            return response.data[0].embedding
+            embedding = _normalize(response.data[0].embedding)
+            self._embedding_cache[question] = embedding
+            return embedding
         except Exception as e:
             logger.error(f"Failed to generate question embedding: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    async def find_cached_answer(self, question_embedding: List[float], score_threshold: float,
+                                 max_age_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Find the stored answer of a semantically similar question.
+        Qdrant errors are logged and treated as a cache miss.
+        
+        Args:
+            question_embedding: Embedding of the incoming question
+            score_threshold: Minimum cosine similarity to the stored question
+            max_age_seconds: Ignore answers stored longer ago than this
+            
+        Returns:
+            Dict containing the answer, or None
+        """
+        try:
+            search_result = await self.qdrant_client.search(
+                collection_name=self.answer_cache_collection_name,
+                query_vector=question_embedding,
+                query_filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="created_at",
+                            range=models.Range(gte=time.time() - max_age_seconds)
+                        )
+                    ]
+                ),
+                limit=1,
+                score_threshold=score_threshold
+            )
+            if not search_result:
+                return None
+
+            return {"answer": search_result[0].payload["answer"]}
+        except Exception as e:
+            logger.warning(f"Failed to search answer cache: {str(e)}")
+            return None
+
+    async def cache_answer(self, question: str, question_embedding: List[float], answer: Dict[str, Any],
+                           max_age_seconds: int) -> None:
+        """
+        Store an answer keyed by the embedding of its question.
+        The point ID is derived from the question, so answering the same
+        question again overwrites its entry; expired entries are deleted
+        every ANSWER_CACHE_PURGE_INTERVAL_SECONDS. Qdrant errors are logged
+        and otherwise ignored.
+        
+        Args:
+            question: The normalized question text
+            question_embedding: Embedding of the question
+            answer: Dict containing the answer
+            max_age_seconds: Age after which stored answers are deleted
+        """
+        try:
+            await self.qdrant_client.upsert(
+                collection_name=self.answer_cache_collection_name,
+                points=[
+                    models.PointStruct(
+                        id=_point_id(question),
+                        vector=question_embedding,
+                        payload={
+                            "question": question,
+                            "answer": answer["answer"],
+                            "created_at": time.time()
+                        }
+                    )
+                ],
+                wait=False
+            )
+
+            if time.monotonic() - self._answer_cache_purged_at >= ANSWER_CACHE_PURGE_INTERVAL_SECONDS:
+                self._answer_cache_purged_at = time.monotonic()
+                await self.qdrant_client.delete(
+                    collection_name=self.answer_cache_collection_name,
+                    points_selector=models.FilterSelector(
+                        filter=models.Filter(
+                            must=[
+                                models.FieldCondition(
+                                    key="created_at",
+                                    range=models.Range(lt=time.time() - max_age_seconds)
+                                )
+                            ]
+                        )
+                    ),
+                    wait=False
+                )
+        except Exception as e:
+            logger.warning(f"Failed to store answer in cache: {str(e)}")